@@ -65,6 +65,42 @@ SIMPLE_JWT = {
     'LEEWAY': 0,
 }
 
+# Token bucket throttling per route class; see LittleLemonAPI/throttling.py.
+# burst is the bucket size, refill_rate the tokens added back per second.
+# Buckets are shared between workers through the default cache, so point
+# CACHES at Redis or Memcached in production; LocMemBucketStore keeps them
+# per process, which multiplies the limits by the number of workers.
+# Allowed/throttled counts are logged every COUNTER_LOG_INTERVAL seconds.
+TOKEN_BUCKET_THROTTLE = {
+    'STORE': 'LittleLemonAPI.throttling.CacheBucketStore',
+    'COUNTER_LOG_INTERVAL': 60,
+    'RATES': {
+        'auth': {'burst': 10, 'refill_rate': 10 / 60},
+        'cart': {'burst': 30, 'refill_rate': 1},
+        'menu': {'burst': 60, 'refill_rate': 5},
+        'orders': {'burst': 30, 'refill_rate': 1},
+    },
+}
+
+# Seconds a location's cached stock map is served before being re-read; it is
+# also dropped whenever that location's stock changes
+LOCATION_AVAILABILITY_TTL = 60
+
+# How far before ?since= order history deltas re-read. updated_at is set when
+# a row is written, not when it commits, so this must exceed the longest
+# transaction that writes orders
+ORDER_SYNC_OVERLAP = timedelta(seconds=60)
+
+# How long a response is replayed for a repeated Idempotency-Key header
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# How long a key stays claimed by a request that has not finished; keep it
+# above the worker timeout so a retry can take over from a killed worker
+IDEMPOTENCY_IN_FLIGHT_LEASE = timedelta(seconds=60)
+
+# How long processed outbox events are kept before purge_outbox_events deletes them
+OUTBOX_DONE_RETENTION = timedelta(days=7)
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -103,6 +139,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed test database so concurrency tests see SQLite's busy
+        # timeout instead of the shared-cache "table is locked" errors.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
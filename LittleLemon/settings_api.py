@@ -0,0 +1,48 @@
+"""
+API-only settings profile for LittleLemon.
+
+Extends the default settings for worker pods that only serve the JWT API:
+the admin, sessions, messages, static files and the middleware built on them
+(sessions, CSRF, Django auth, messages) are left out, and responses are
+rendered as JSON only, so workers import and hold less. Select it with
+DJANGO_SETTINGS_MODULE=LittleLemon.settings_api; `manage.py benchmark_startup`
+compares it with the full profile.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in (
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+    )
+]
+
+# JWTAuthentication sets request.user itself, so neither sessions nor Django's
+# AuthenticationMiddleware are needed, and token auth is not exposed to CSRF.
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware not in (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    )
+]
+
+ROOT_URLCONF = 'LittleLemon.urls_api'
+
+# The browsable API is the only thing that renders templates
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+    ),
+}
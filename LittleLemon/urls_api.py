@@ -0,0 +1,10 @@
+"""
+URL configuration for the API-only settings profile (LittleLemon.settings_api).
+
+Same as LittleLemon.urls without the admin site.
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('LittleLemonAPI.urls')),
+]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.models import User, Group
-from .models import FoodItem, Order, Category
+from .models import FoodItem, Order, ArchivedOrder, Category, OutboxEvent, Location, LocationStock
 from django import forms
 
 # Unregister the default User and Group admin classes
@@ -11,6 +11,17 @@ admin.site.unregister(Group)
 class FoodItemAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'price', 'is_item_of_the_day', 'category')
 
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'address')
+
+@admin.register(LocationStock)
+class LocationStockAdmin(admin.ModelAdmin):
+    list_display = ('id', 'location', 'food_item', 'stock')
+    list_editable = ('stock',)
+    list_filter = ('location',)
+    list_select_related = ('location', 'food_item')
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
@@ -35,5 +46,14 @@ class OrderAdminForm(forms.ModelForm):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'customer_name', 'food_item', 'delivery_status')
+    list_display = ('id', 'customer_name', 'food_item', 'location', 'delivery_status')
     form = OrderAdminForm
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer_name', 'food_item', 'location', 'delivery_status', 'archived_at')
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'status', 'attempts', 'available_at', 'processed_at')
+    list_filter = ('status', 'event_type')
@@ -0,0 +1,102 @@
+"""
+Moves delivered orders out of the hot Order table into ArchivedOrder.
+
+Each batch copies rows with a single ``INSERT ... SELECT`` and deletes them in
+the same short transaction, so the Order table is never locked for longer
+than one batch. Deletes are plain SQL rather than ``QuerySet.delete()`` so no
+post_delete signal fires: an archived order is still part of the customer's
+history, not a deletion, so it must not leave a tombstone.
+"""
+import time
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.db.models import DateTimeField, Value
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order
+
+ARCHIVED_COLUMNS = ['id', 'customer_name', 'food_item_id', 'delivery_status', 'delivery_crew_member_id',
+                    'location_id', 'updated_at']
+
+
+@dataclass
+class ArchiveStats:
+    rows: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    lock_time: float = 0.0
+    max_lock_time: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Archive up to ``batch_size`` orders delivered before ``cutoff``.
+
+    Returns the number of rows moved and how long the transaction held them.
+    """
+    due = Order.objects.filter(delivery_status='Delivered', updated_at__lt=cutoff)
+    due_ids = due.order_by('id').values_list('id', flat=True)
+    locks_rows = connection.features.has_select_for_update_skip_locked
+
+    if not locks_rows:
+        # SQLite cannot safely upgrade a read lock to a write lock under
+        # contention, so pick the batch before the write transaction starts
+        ids = list(due_ids[:batch_size])
+        if not ids:
+            return 0, 0.0
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        if locks_rows:
+            ids = list(due_ids.select_for_update(skip_locked=True)[:batch_size])
+            if not ids:
+                return 0, time.perf_counter() - started
+
+        # Conditions are re-applied so rows changed since they were picked stay put
+        batch = due.filter(id__in=ids)
+        select = batch.values(*ARCHIVED_COLUMNS, archived_at=Value(timezone.now(), output_field=DateTimeField()))
+        select_sql, params = select.query.sql_with_params()
+        columns = ', '.join(connection.ops.quote_name(ArchivedOrder._meta.get_field(column).column)
+                            for column in ARCHIVED_COLUMNS + ['archived_at'])
+        order_table = connection.ops.quote_name(Order._meta.db_table)
+        archive_table = connection.ops.quote_name(ArchivedOrder._meta.db_table)
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {archive_table} ({columns}) {select_sql}', params)
+            moved = cursor.rowcount
+            # Only rows that made it into the archive are removed
+            pk = connection.ops.quote_name(Order._meta.pk.column)
+            cursor.execute(f'DELETE FROM {order_table} WHERE {pk} IN ({placeholders}) '
+                           f'AND {pk} IN (SELECT {pk} FROM {archive_table} WHERE {pk} IN ({placeholders}))', ids + ids)
+
+    return moved, time.perf_counter() - started
+
+
+def archive_delivered_orders(older_than, batch_size=500, max_batches=None, pause=0.0):
+    """
+    Archive orders delivered more than ``older_than`` ago, batch by batch.
+
+    ``pause`` seconds are slept between batches to leave room for live traffic.
+    """
+    cutoff = timezone.now() - older_than
+    stats = ArchiveStats()
+    started = time.perf_counter()
+
+    while max_batches is None or stats.batches < max_batches:
+        moved, lock_time = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        stats.rows += moved
+        stats.batches += 1
+        stats.lock_time += lock_time
+        stats.max_lock_time = max(stats.max_lock_time, lock_time)
+        if pause:
+            time.sleep(pause)
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
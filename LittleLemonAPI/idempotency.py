@@ -0,0 +1,150 @@
+"""
+Idempotency-Key support for endpoints that mobile clients retry.
+
+The first request with a given key runs the view and stores its response;
+repeats within ``IDEMPOTENCY_KEY_TTL`` get the stored response back without
+running the view again. A key whose first request never finished (the
+worker was killed or timed out) can be retried once its
+``IDEMPOTENCY_IN_FLIGHT_LEASE`` runs out.
+
+``IdempotencyRecord`` is the source of truth: every keyed request that is not
+a cached replay costs a SELECT and, for a new key, an INSERT before the view
+runs, because the row's unique constraint is what stops concurrent duplicates.
+The cache only speeds up replays of completed requests on the same cache;
+other replays are read from the table, so they also work across workers.
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+
+
+def _sha256(*parts):
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def _fingerprint(request):
+    # Parsed rather than raw, so a retry with a new multipart boundary or
+    # reordered JSON keys still counts as the same request
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return _sha256(json.dumps(data, sort_keys=True, default=str))
+
+
+def _replay(status_code, body):
+    response = Response(body, status=status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _reserve(key, fingerprint):
+    """
+    Insert the in-flight record for ``key``; returns ``(record, created)``.
+
+    The unique constraint on ``key`` is what serialises concurrent duplicates:
+    exactly one request creates the record and runs the view.
+    """
+    now = timezone.now()
+    existing = IdempotencyRecord.objects.filter(key=key).first()
+    if existing is None:
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(
+                    key=key, fingerprint=fingerprint, expires_at=now + settings.IDEMPOTENCY_KEY_TTL,
+                    locked_until=now + settings.IDEMPOTENCY_IN_FLIGHT_LEASE,
+                )
+            return record, True
+        except IntegrityError:
+            existing = IdempotencyRecord.objects.filter(key=key).first()
+
+    stale = existing is not None and existing.status_code is None and (
+        existing.locked_until is None or existing.locked_until <= now)
+    if existing is not None and (existing.expires_at <= now or stale):
+        # Either the record outlived its TTL but was not purged yet, or the
+        # request that created it died without finishing; take it over
+        IdempotencyRecord.objects.filter(id=existing.id).delete()
+        return _reserve(key, fingerprint)
+    return existing, False
+
+
+def idempotent(view_func):
+    """
+    Make a view replay its response for a repeated ``Idempotency-Key`` header.
+
+    Requests without the header are passed straight through. A repeat that
+    arrives while the first request is still running gets 409, and reusing a
+    key for a different request body gets 422. Server errors are not stored,
+    so the client can retry them with the same key. Only the request that
+    currently holds the record may complete or release it, so a request that
+    overran its lease cannot overwrite the retry that took over.
+    """
+    @functools.wraps(view_func)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if isinstance(arg, Request))
+        client_key = request.headers.get(HEADER)
+        if not client_key:
+            return view_func(*args, **kwargs)
+        if len(client_key) > 255:
+            return Response({"error": f"{HEADER} must be at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = _sha256(str(request.user.pk), request.method, request.path, client_key)
+        fingerprint = _fingerprint(request)
+        cache_key = f'idempotency:{key}'
+
+        cached = cache.get(cache_key)
+        if cached is not None and cached['fingerprint'] == fingerprint:
+            return _replay(cached['status_code'], cached['body'])
+
+        record, created = _reserve(key, fingerprint)
+        if not created:
+            if record.fingerprint != fingerprint:
+                return Response({"error": f"{HEADER} was already used for a different request."},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record.status_code is None:
+                return Response({"error": "A request with this key is still being processed."},
+                                status=status.HTTP_409_CONFLICT)
+            return _replay(record.status_code, record.response_body)
+
+        owned = IdempotencyRecord.objects.filter(id=record.id, status_code__isnull=True)
+        try:
+            response = view_func(*args, **kwargs)
+        except Exception:
+            owned.delete()
+            raise
+
+        if response.status_code >= 500:
+            owned.delete()
+            return response
+
+        if owned.update(status_code=response.status_code, response_body=response.data, locked_until=None):
+            cache.set(cache_key, {'fingerprint': fingerprint, 'status_code': response.status_code,
+                                  'body': response.data},
+                      timeout=settings.IDEMPOTENCY_KEY_TTL.total_seconds())
+        return response
+
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    """
+    Delete expired records in bounded batches; returns the number deleted.
+    """
+    deleted = 0
+    while True:
+        expired_ids = list(IdempotencyRecord.objects.filter(expires_at__lte=timezone.now())
+                           .values_list('id', flat=True)[:batch_size])
+        if not expired_ids:
+            return deleted
+        deleted += IdempotencyRecord.objects.filter(id__in=expired_ids).delete()[0]
@@ -0,0 +1,76 @@
+"""
+Per-location stock: cached availability for the menu endpoints and stock
+reservation at checkout.
+
+Availability is cached as one ``{food_item_id: stock}`` map per location so a
+menu listing costs at most one stock query however many items it shows. The
+cache is dropped whenever stock changes and only ever informs customers; the
+conditional UPDATE in ``reserve_stock`` is what actually prevents overselling.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import LocationStock
+
+
+class OutOfStock(Exception):
+    """
+    Raised by ``reserve_stock`` with the food items that could not be reserved.
+    """
+
+    def __init__(self, food_items):
+        self.food_items = food_items
+        super().__init__(", ".join(food_item.name for food_item in food_items))
+
+
+def _cache_key(location_id):
+    return f'availability:{location_id}'
+
+
+def availability(location_id):
+    """
+    Map of food item id to stock for everything on the location's menu.
+    """
+    stock = cache.get(_cache_key(location_id))
+    if stock is None:
+        stock = dict(LocationStock.objects.filter(location_id=location_id).values_list('food_item_id', 'stock'))
+        cache.set(_cache_key(location_id), stock, timeout=settings.LOCATION_AVAILABILITY_TTL)
+    return stock
+
+
+def invalidate_availability(location_id):
+    # Deferred to commit so a concurrent reader cannot re-cache the old stock
+    transaction.on_commit(lambda: cache.delete(_cache_key(location_id)))
+
+
+def reserve_stock(location, cart_items):
+    """
+    Take the cart's quantities out of the location's stock.
+
+    Must run inside the checkout transaction: each item is decremented with
+    ``UPDATE ... SET stock = stock - n WHERE stock >= n``, and if any item is
+    short ``OutOfStock`` is raised so the caller rolls everything back. Items
+    are updated in id order so concurrent checkouts lock rows consistently.
+    """
+    quantities = Counter()
+    food_items = {}
+    for cart_item in cart_items:
+        quantities[cart_item.food_item_id] += cart_item.quantity
+        food_items[cart_item.food_item_id] = cart_item.food_item
+
+    short = []
+    for food_item_id in sorted(quantities):
+        quantity = quantities[food_item_id]
+        reserved = LocationStock.objects.filter(
+            location=location, food_item_id=food_item_id, stock__gte=quantity,
+        ).update(stock=F('stock') - quantity)
+        if not reserved:
+            short.append(food_items[food_item_id])
+
+    if short:
+        raise OutOfStock(short)
+    invalidate_availability(location.id)
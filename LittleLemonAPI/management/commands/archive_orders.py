@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.archive import archive_delivered_orders
+
+class Command(BaseCommand):
+    help = 'Moves delivered orders older than N days into the order archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Archive orders delivered more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders moved per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--every', type=float, default=None,
+                            help='Keep running and archive again every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = archive_delivered_orders(
+                timedelta(days=options['days']),
+                batch_size=options['batch_size'],
+                max_batches=options['max_batches'],
+                pause=options['pause'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {stats.rows} order(s) in {stats.batches} batch(es): '
+                f'{stats.rows_per_second:.0f} rows/s, lock time {stats.lock_time:.3f}s total, '
+                f'{stats.max_lock_time:.3f}s max per batch.'
+            ))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,92 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework_simplejwt.tokens import AccessToken
+
+# Runs in a fresh interpreter per measurement so nothing is already imported.
+# Arguments: path, access token, database name.
+PROBE = """
+import io, json, resource, sys, time
+start = time.perf_counter()
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = sys.argv[3]
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+startup = time.perf_counter() - start
+
+statuses = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_AUTHORIZATION': f'Bearer {sys.argv[2]}',
+    'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+    'wsgi.errors': sys.stderr, 'wsgi.multithread': False, 'wsgi.multiprocess': True,
+}
+start = time.perf_counter()
+b''.join(application(environ, lambda status, headers: statuses.append(status)))
+first_request = time.perf_counter() - start
+
+print(json.dumps({
+    'startup': startup,
+    'first_request': first_request,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+    'status': statuses[0],
+}))
+"""
+
+class Command(BaseCommand):
+    help = 'Compares import time and memory of the full and API-only settings profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters started per profile.')
+        parser.add_argument('--path', default='/api/food-items/', help='Path requested once after startup.')
+        parser.add_argument('--username', help='User the request is authenticated as; defaults to the first active user.')
+        parser.add_argument('--profiles', nargs='+', default=['LittleLemon.settings', 'LittleLemon.settings_api'],
+                            help='Settings modules to compare.')
+
+    def measure(self, profile, path, token):
+        # The probe uses this process's database, so under tests it sees the test database
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': profile}
+        args = [sys.executable, '-c', PROBE, path, token, str(connection.settings_dict['NAME'])]
+        start = time.perf_counter()
+        result = subprocess.run(args, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        sample['cold_start'] = time.perf_counter() - start
+        return sample
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('No active user to authenticate the request as; create one or pass --username.')
+        token = str(AccessToken.for_user(user))
+
+        self.stdout.write(f"{'profile':<28}{'cold start':>12}{'django':>10}{'1st req':>10}{'max RSS':>11}{'modules':>9}  status")
+        for profile in options['profiles']:
+            samples = [self.measure(profile, options['path'], token) for _ in range(options['runs'])]
+
+            def median(field):
+                return statistics.median(sample[field] for sample in samples)
+
+            self.stdout.write(
+                f"{profile:<28}"
+                f"{median('cold_start') * 1000:>10.0f}ms"
+                f"{median('startup') * 1000:>8.0f}ms"
+                f"{median('first_request') * 1000:>8.1f}ms"
+                f"{median('max_rss_kb') / 1024:>9.1f}MB"
+                f"{median('modules'):>9.0f}"
+                f"  {samples[0]['status']}"
+            )
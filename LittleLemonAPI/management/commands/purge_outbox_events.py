@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.outbox import purge_done
+
+class Command(BaseCommand):
+    help = 'Deletes processed outbox events older than OUTBOX_DONE_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement.')
+
+    def handle(self, *args, **options):
+        deleted = purge_done(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} processed outbox event(s).'))
@@ -0,0 +1,33 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI import outbox
+
+class Command(BaseCommand):
+    help = 'Processes pending outbox events in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events leased per batch.')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Attempts before an event is marked Failed.')
+        parser.add_argument('--lease-seconds', type=int, default=60, help='How long a leased event is held before another worker may retry it.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit.')
+
+    def handle(self, *args, **options):
+        worker_id = f'{socket.gethostname()}-{os.getpid()}'
+
+        while True:
+            succeeded, failed = outbox.drain(
+                worker_id,
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+                lease_seconds=options['lease_seconds'],
+            )
+            if succeeded or failed:
+                self.stdout.write(self.style.SUCCESS(f'Processed {succeeded} event(s), {failed} failed.'))
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0011_order_updated_at_ordertombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('address', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LocationStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('food_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='LittleLemonAPI.fooditem')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='LittleLemonAPI.location')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='LittleLemonAPI.location'),
+        ),
+        migrations.AddConstraint(
+            model_name='locationstock',
+            constraint=models.UniqueConstraint(fields=('location', 'food_item'), name='unique_location_food_item'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def merge_delivery_crew_groups(apps, schema_editor):
+    # Older views assigned crew to "DeliveryCrew"; everything now checks "Delivery Crew"
+    Group = apps.get_model('auth', 'Group')
+    old_group = Group.objects.filter(name='DeliveryCrew').first()
+    if old_group is None:
+        return
+    crew_group, _ = Group.objects.get_or_create(name='Delivery Crew')
+    crew_group.user_set.add(*old_group.user_set.all())
+    old_group.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('LittleLemonAPI', '0013_archivedorder'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_delivery_crew_groups, migrations.RunPython.noop),
+    ]
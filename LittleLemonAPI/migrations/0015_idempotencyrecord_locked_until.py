@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0014_merge_deliverycrew_group'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
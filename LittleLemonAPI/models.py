@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class Category(models.Model):
@@ -18,6 +19,27 @@ class FoodItem(models.Model):
     def __str__(self):
         return self.name
 
+class Location(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    address = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.name
+
+class LocationStock(models.Model):
+    # A food item is on a location's menu when it has a stock row there
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='stock')
+    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='stock')
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'food_item'], name='unique_location_food_item'),
+        ]
+
+    def __str__(self):
+        return f"{self.food_item.name} at {self.location.name}: {self.stock}"
+
 class Order(models.Model):
     DELIVERY_STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -28,10 +50,51 @@ class Order(models.Model):
     food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE)
     delivery_status = models.CharField(max_length=10, choices=DELIVERY_STATUS_CHOICES, default='Pending')
     delivery_crew_member = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="orders_assigned")
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    # Not touched by QuerySet.update(); bulk updates must set it explicitly
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_name', 'updated_at']),
+        ]
 
     def __str__(self):
         return f"Order for {self.customer_name}"
 
+class ArchivedOrder(models.Model):
+    # Delivered orders moved out of Order by the archive_orders command, ids kept
+    id = models.BigIntegerField(primary_key=True)
+    customer_name = models.CharField(max_length=100)
+    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='+')
+    delivery_status = models.CharField(max_length=10, choices=Order.DELIVERY_STATUS_CHOICES)
+    delivery_crew_member = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_name', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Archived order for {self.customer_name}"
+
+class OrderTombstone(models.Model):
+    # Left behind by deleted orders so delta syncs can tell clients to drop them
+    order_id = models.BigIntegerField()
+    customer_name = models.CharField(max_length=100)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_name', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"Deleted order {self.order_id}"
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,3 +109,46 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.food_item.name} (x{self.quantity}) in {self.cart.user.username}'s cart"
+
+class OutboxEvent(models.Model):
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Processing', 'Processing'),
+        ('Done', 'Done'),
+        ('Failed', 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} ({self.status})"
+
+class IdempotencyRecord(models.Model):
+    # sha256 of user, method, path and the client's Idempotency-Key header
+    key = models.CharField(max_length=64, unique=True)
+    # sha256 of the parsed request data, to reject a key reused for a different request
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    # Set while the first request is running; a retry may take over once it passes
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency record {self.key[:12]}"
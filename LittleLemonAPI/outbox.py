@@ -0,0 +1,172 @@
+"""
+Transactional outbox for side effects that should not run inside a request.
+
+Views call ``publish`` inside the same transaction as the change that caused
+the event, so an event exists if and only if that change was committed. The
+``run_outbox_worker`` management command drains events in batches and hands
+them to the handlers registered with ``handler``; ``purge_outbox_events``
+deletes processed events once they are older than ``OUTBOX_DONE_RETENTION``.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def handler(event_type):
+    """
+    Register a function to process events of the given type.
+
+    Handlers receive the ``OutboxEvent`` and may be called more than once for
+    the same event (e.g. after a worker crash), so anything with external
+    effects should dedupe on ``event.idempotency_key``.
+    """
+    def register(func):
+        _handlers[event_type] = func
+        return func
+    return register
+
+
+def publish(event_type, payload, idempotency_key=None):
+    """
+    Record an event in the current transaction.
+
+    Publishing the same idempotency key twice is a no-op, so callers can use a
+    natural key (e.g. ``order.delivered:<id>``) to avoid duplicate events.
+    """
+    if idempotency_key is None:
+        idempotency_key = f'{event_type}:{uuid.uuid4().hex}'
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(event_type=event_type, payload=payload, idempotency_key=idempotency_key)],
+        ignore_conflicts=True,
+    )
+
+
+def _ready(now):
+    # Pending events that are due, plus events whose worker lease has expired
+    return Q(status='Pending', available_at__lte=now) | Q(status='Processing', locked_until__lt=now)
+
+
+def claim_batch(worker_id, batch_size, lease_seconds, max_attempts=5):
+    """
+    Lease up to ``batch_size`` due events to this worker.
+
+    Like ``claim_next_order``, this uses SKIP LOCKED where the backend has it
+    and otherwise relies on the conditional UPDATE only matching rows nobody
+    else has leased in the meantime.
+
+    An expired lease means the worker holding the event crashed or hung, so
+    it counts as a failed attempt; events that run out of attempts that way
+    are parked as Failed instead of being leased again.
+    """
+    now = timezone.now()
+    lease_token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    stranded = OutboxEvent.objects.filter(status='Processing', locked_until__lt=now)
+    parked = stranded.filter(attempts__gte=max_attempts - 1).update(
+        status='Failed',
+        attempts=F('attempts') + 1,
+        last_error='Lease expired before the event was processed.',
+        locked_by='',
+        locked_until=None,
+    )
+    if parked:
+        logger.error("Parked %s outbox event(s) whose leases kept expiring", parked)
+
+    ready = OutboxEvent.objects.filter(_ready(now)).order_by('id')
+
+    def lease(candidate_ids):
+        OutboxEvent.objects.filter(_ready(now), id__in=candidate_ids).update(
+            status='Processing',
+            attempts=Case(When(status='Processing', then=F('attempts') + 1), default=F('attempts'),
+                          output_field=PositiveIntegerField()),
+            locked_by=lease_token,
+            locked_until=now + timedelta(seconds=lease_seconds),
+        )
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            lease(list(ready.select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size]))
+    else:
+        lease(list(ready.values_list('id', flat=True)[:batch_size]))
+
+    return list(OutboxEvent.objects.filter(locked_by=lease_token, status='Processing').order_by('id'))
+
+
+def process_event(event, max_attempts):
+    """
+    Run the handler for one leased event and record the outcome.
+
+    Failures are retried with exponential backoff until ``max_attempts`` is
+    reached, after which the event is parked as Failed. Events nobody handles
+    are parked as Failed straight away rather than acknowledged; set them back
+    to Pending once a handler is deployed. Outcomes are only written while the
+    lease is still ours, so a worker that overran its lease cannot clobber the
+    result of the worker that took the event over.
+    """
+    owned = OutboxEvent.objects.filter(id=event.id, locked_by=event.locked_by, status='Processing')
+    event_handler = _handlers.get(event.event_type)
+
+    if event_handler is None:
+        logger.error("Outbox event %s has no handler for %s; parking it as Failed", event.id, event.event_type)
+        owned.update(status='Failed', last_error=f"No handler registered for {event.event_type}.",
+                     locked_by='', locked_until=None)
+        return False
+
+    try:
+        event_handler(event)
+    except Exception as exc:
+        attempts = event.attempts + 1
+        logger.warning("Outbox event %s (%s) failed on attempt %s: %s", event.id, event.event_type, attempts, exc)
+        owned.update(
+            status='Failed' if attempts >= max_attempts else 'Pending',
+            attempts=attempts,
+            last_error=str(exc),
+            available_at=timezone.now() + timedelta(seconds=min(2 ** attempts, 300)),
+            locked_by='',
+            locked_until=None,
+        )
+        return False
+
+    owned.update(status='Done', processed_at=timezone.now(), locked_by='', locked_until=None)
+    return True
+
+
+def drain(worker_id, batch_size=100, max_attempts=5, lease_seconds=60):
+    """
+    Process batches until no due events are left; returns (succeeded, failed).
+    """
+    succeeded = failed = 0
+    while True:
+        events = claim_batch(worker_id, batch_size, lease_seconds, max_attempts)
+        if not events:
+            return succeeded, failed
+        for event in events:
+            if process_event(event, max_attempts):
+                succeeded += 1
+            else:
+                failed += 1
+
+
+def purge_done(batch_size=1000):
+    """
+    Delete events processed more than ``OUTBOX_DONE_RETENTION`` ago in bounded
+    batches; returns the number deleted. Failed events are kept for inspection.
+    """
+    cutoff = timezone.now() - settings.OUTBOX_DONE_RETENTION
+    deleted = 0
+    while True:
+        done_ids = list(OutboxEvent.objects.filter(status='Done', processed_at__lt=cutoff)
+                        .values_list('id', flat=True)[:batch_size])
+        if not done_ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(id__in=done_ids).delete()[0]
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import FoodItem, Order, Cart, CartItem
-from .models import Category
+from .models import Category, Location
 from django.contrib.auth.models import User
 
 class FoodItemSerializer(serializers.ModelSerializer):
@@ -9,10 +9,35 @@ class FoodItemSerializer(serializers.ModelSerializer):
         model = FoodItem
         fields = ('id', 'name', 'description', 'price', 'is_item_of_the_day', 'category')
 
+class LocationFoodItemSerializer(FoodItemSerializer):
+    # Read from the availability map in the context, not queried per item
+    stock = serializers.SerializerMethodField()
+
+    class Meta(FoodItemSerializer.Meta):
+        fields = FoodItemSerializer.Meta.fields + ('stock',)
+
+    def get_stock(self, obj):
+        return self.context['stock'].get(obj.id, 0)
+
+class LocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Location
+        fields = ['id', 'name', 'address']
+
 class OrderSerializer(serializers.ModelSerializer): 
     class Meta:
         model = Order
-        fields = ['id', 'customer_name', 'total_price', 'delivered', 'delivery_crew_member', ...]
+        fields = ['id', 'customer_name', 'food_item', 'delivery_status', 'delivery_crew_member', 'location', 'updated_at']
+
+class OrderHistorySerializer(serializers.Serializer):
+    # Renders rows from Order and ArchivedOrder alike, in OrderSerializer's shape
+    id = serializers.IntegerField()
+    customer_name = serializers.CharField()
+    food_item = serializers.IntegerField(source='food_item_id')
+    delivery_status = serializers.CharField()
+    delivery_crew_member = serializers.IntegerField(source='delivery_crew_member_id', allow_null=True)
+    location = serializers.IntegerField(source='location_id', allow_null=True)
+    updated_at = serializers.DateTimeField()
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
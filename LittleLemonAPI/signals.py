@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .inventory import invalidate_availability
+from .models import ArchivedOrder, LocationStock, Order, OrderTombstone
+
+# Archived orders are still history, so deleting one (e.g. by cascade from its
+# food item) must be synced to clients too
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=ArchivedOrder)
+def record_order_tombstone(sender, instance, **kwargs):
+    OrderTombstone.objects.create(order_id=instance.id, customer_name=instance.customer_name)
+
+@receiver(post_save, sender=LocationStock)
+@receiver(post_delete, sender=LocationStock)
+def invalidate_location_availability(sender, instance, **kwargs):
+    invalidate_availability(instance.location_id)
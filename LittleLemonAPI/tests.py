@@ -1,3 +1,988 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import outbox, throttling
+from .archive import archive_delivered_orders
+from .idempotency import purge_expired
+from .management.commands.benchmark_startup import Command as BenchmarkStartupCommand
+from .models import (ArchivedOrder, Cart, CartItem, Category, FoodItem, IdempotencyRecord, Location, LocationStock,
+                     Order, OrderTombstone, OutboxEvent)
+from .views import claim_next_order
+
+
+# The production rates would make results depend on how many requests earlier
+# tests happened to send, so they are off unless a test sets its own
+unthrottled = override_settings(TOKEN_BUCKET_THROTTLE={
+    'STORE': 'LittleLemonAPI.throttling.LocMemBucketStore',
+    'RATES': {},
+})
+
+
+def setUpModule():
+    unthrottled.enable()
+
+
+def tearDownModule():
+    unthrottled.disable()
+
+
+def make_crew_member(username):
+    user = User.objects.create_user(username=username, password='secret-pass-123')
+    crew_group, _ = Group.objects.get_or_create(name='Delivery Crew')
+    user.groups.add(crew_group)
+    return user
+
+
+def make_food_item(name='Lemon Cake', price='6.50'):
+    category, _ = Category.objects.get_or_create(name='Desserts')
+    return FoodItem.objects.create(name=name, description=name, price=price, category=category)
+
+
+class DeliveryCrewQueueTests(TestCase):
+
+    def setUp(self):
+        self.crew = make_crew_member('crew')
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+        self.food_item = make_food_item()
+
+    def test_claim_next_assigns_oldest_pending_order(self):
+        first = Order.objects.create(customer_name='alice', food_item=self.food_item)
+        Order.objects.create(customer_name='bob', food_item=self.food_item)
+
+        response = self.client.post('/api/orders/claim-next/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], first.id)
+        first.refresh_from_db()
+        self.assertEqual(first.delivery_crew_member, self.crew)
+
+    def test_claim_next_skips_assigned_and_delivered_orders(self):
+        other = make_crew_member('other-crew')
+        Order.objects.create(customer_name='alice', food_item=self.food_item, delivery_crew_member=other)
+        Order.objects.create(customer_name='bob', food_item=self.food_item, delivery_status='Delivered')
+
+        response = self.client.post('/api/orders/claim-next/')
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_claim_next_skips_orders_delivered_after_being_picked(self):
+        order = Order.objects.create(customer_name='alice', food_item=self.food_item)
+        values_list = QuerySet.values_list
+
+        def delivered_meanwhile(queryset, *fields, **kwargs):
+            candidate_ids = list(values_list(queryset, *fields, **kwargs))
+            Order.objects.filter(id__in=candidate_ids).update(delivery_status='Delivered')
+            return candidate_ids
+
+        with mock.patch.object(QuerySet, 'values_list', autospec=True, side_effect=delivered_meanwhile):
+            claimed = claim_next_order(self.crew)
+
+        self.assertIsNone(claimed)
+        self.assertIsNone(Order.objects.get(id=order.id).delivery_crew_member)
+
+    def test_claim_next_requires_delivery_crew(self):
+        customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        self.client.force_authenticate(customer)
+
+        response = self.client.post('/api/orders/claim-next/')
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_batch_mark_delivered_only_touches_own_pending_orders(self):
+        other = make_crew_member('other-crew')
+        mine = Order.objects.create(customer_name='alice', food_item=self.food_item, delivery_crew_member=self.crew)
+        theirs = Order.objects.create(customer_name='bob', food_item=self.food_item, delivery_crew_member=other)
+
+        response = self.client.post('/api/orders/mark-delivered/', {'order_ids': [mine.id, theirs.id]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['delivered'], [mine.id])
+        self.assertEqual(response.data['skipped'], [theirs.id])
+        self.assertEqual(Order.objects.get(id=mine.id).delivery_status, 'Delivered')
+        self.assertEqual(Order.objects.get(id=theirs.id).delivery_status, 'Pending')
+
+    def test_batch_mark_delivered_rejects_bad_payload(self):
+        order = Order.objects.create(customer_name='alice', food_item=self.food_item, delivery_crew_member=self.crew)
+
+        for order_ids in ['nope', str(order.id), {str(order.id): True}, []]:
+            response = self.client.post('/api/orders/mark-delivered/', {'order_ids': order_ids}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(Order.objects.get(id=order.id).delivery_status, 'Pending')
+
+    def test_claimed_order_is_listed_and_can_be_marked_delivered(self):
+        order = Order.objects.create(customer_name='alice', food_item=self.food_item)
+        self.client.post('/api/orders/claim-next/')
+
+        listed = self.client.get('/api/orders/')
+        delivered = self.client.post(f'/api/orders/{order.id}/mark-delivered/')
+
+        self.assertEqual([row['id'] for row in listed.data['results']], [order.id])
+        self.assertEqual(delivered.status_code, 200)
+        self.assertEqual(Order.objects.get(id=order.id).delivery_status, 'Delivered')
+
+    def test_crew_assigned_through_the_api_can_claim(self):
+        manager = User.objects.create_user(username='manager', password='secret-pass-123', is_staff=True)
+        recruit = User.objects.create_user(username='recruit', password='secret-pass-123')
+        Order.objects.create(customer_name='alice', food_item=self.food_item)
+        self.client.force_authenticate(manager)
+        self.client.post('/api/assign-to-delivery-crew/', {'user_id': recruit.id}, format='json')
+
+        self.client.force_authenticate(recruit)
+        response = self.client.post('/api/orders/claim-next/')
+
+        self.assertEqual(response.status_code, 200)
+
+
+class DeliveryCrewQueueConcurrencyTests(TransactionTestCase):
+    workers = 8
+    orders = 40
+
+    def test_parallel_crew_never_claim_the_same_order(self):
+        food_item = make_food_item()
+        crew = [make_crew_member(f'crew-{i}') for i in range(self.workers)]
+        Order.objects.bulk_create(
+            Order(customer_name=f'customer-{i}', food_item=food_item) for i in range(self.orders)
+        )
+
+        claimed = []
+        claimed_lock = threading.Lock()
+        start = threading.Barrier(self.workers)
+
+        def work(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            start.wait()
+            try:
+                while True:
+                    response = client.post('/api/orders/claim-next/')
+                    if response.status_code == 204:
+                        return
+                    with claimed_lock:
+                        claimed.append((response.data['id'], user.id))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(user,)) for user in crew]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed_ids = [order_id for order_id, _ in claimed]
+        self.assertEqual(len(claimed_ids), self.orders)
+        self.assertEqual(len(set(claimed_ids)), self.orders)
+        for order_id, user_id in claimed:
+            self.assertEqual(Order.objects.get(id=order_id).delivery_crew_member_id, user_id)
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.food_item = make_food_item()
+        self.customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.addCleanup(outbox._handlers.clear)
+
+    def test_place_order_publishes_event_with_the_orders(self):
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, food_item=self.food_item)
+
+        response = self.client.post('/api/place_order/')
+
+        self.assertEqual(response.status_code, 200)
+        event = OutboxEvent.objects.get(event_type='order.placed')
+        self.assertEqual(event.payload['order_ids'], list(Order.objects.values_list('id', flat=True)))
+        self.assertFalse(cart.cart_items.exists())
+
+    def test_publish_is_rolled_back_with_the_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                outbox.publish('order.placed', {})
+                raise RuntimeError
+
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_publish_ignores_duplicate_idempotency_keys(self):
+        outbox.publish('order.delivered', {'order_ids': [1]}, idempotency_key='order.delivered:1')
+        outbox.publish('order.delivered', {'order_ids': [1]}, idempotency_key='order.delivered:1')
+
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_worker_runs_handlers_and_marks_events_done(self):
+        seen = []
+        outbox.handler('order.placed')(lambda event: seen.append(event.payload['order_ids']))
+        outbox.publish('order.placed', {'order_ids': [1, 2]})
+
+        call_command('run_outbox_worker', '--once', stdout=StringIO())
+
+        self.assertEqual(seen, [[1, 2]])
+        self.assertEqual(OutboxEvent.objects.get().status, 'Done')
+
+    def test_failed_events_are_retried_then_parked(self):
+        def explode(event):
+            raise ValueError('kitchen printer offline')
+        outbox.handler('order.placed')(explode)
+        outbox.publish('order.placed', {})
+
+        with self.assertLogs('LittleLemonAPI.outbox', 'WARNING'):
+            for _ in range(2):
+                outbox.drain('test-worker', max_attempts=2)
+                OutboxEvent.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.status, 'Failed')
+        self.assertEqual(event.attempts, 2)
+        self.assertEqual(event.last_error, 'kitchen printer offline')
+
+    def test_events_without_a_handler_are_parked_not_acknowledged(self):
+        outbox.publish('order.placed', {})
+
+        with self.assertLogs('LittleLemonAPI.outbox', 'ERROR'):
+            self.assertEqual(outbox.drain('test-worker'), (0, 1))
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.status, 'Failed')
+        self.assertEqual(event.last_error, 'No handler registered for order.placed.')
+        self.assertIsNone(event.processed_at)
+
+    def test_expired_leases_are_reclaimed(self):
+        outbox.handler('order.placed')(lambda event: None)
+        outbox.publish('order.placed', {})
+        OutboxEvent.objects.update(status='Processing', locked_by='dead-worker',
+                                   locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(outbox.drain('test-worker'), (1, 0))
+        self.assertEqual(OutboxEvent.objects.get().attempts, 1)
+
+    def test_events_whose_leases_keep_expiring_are_parked(self):
+        outbox.handler('order.placed')(lambda event: None)
+        outbox.publish('order.placed', {})
+        OutboxEvent.objects.update(status='Processing', attempts=1, locked_by='dead-worker',
+                                   locked_until=timezone.now() - timedelta(seconds=1))
+
+        with self.assertLogs('LittleLemonAPI.outbox', 'ERROR'):
+            self.assertEqual(outbox.drain('test-worker', max_attempts=2), (0, 0))
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.status, 'Failed')
+        self.assertEqual(event.attempts, 2)
+
+    def test_purge_deletes_old_done_events_only(self):
+        for key in ['old', 'recent', 'failed']:
+            outbox.publish('order.placed', {}, idempotency_key=key)
+        long_ago = timezone.now() - timedelta(days=30)
+        OutboxEvent.objects.filter(idempotency_key='old').update(status='Done', processed_at=long_ago)
+        OutboxEvent.objects.filter(idempotency_key='recent').update(status='Done', processed_at=timezone.now())
+        OutboxEvent.objects.filter(idempotency_key='failed').update(status='Failed', processed_at=long_ago)
+
+        call_command('purge_outbox_events', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(set(OutboxEvent.objects.values_list('idempotency_key', flat=True)), {'recent', 'failed'})
+
+
+class OutboxConcurrencyTests(TransactionTestCase):
+    workers = 4
+    events = 60
+
+    def test_parallel_workers_process_each_event_once(self):
+        processed = []
+        processed_lock = threading.Lock()
+
+        def record(event):
+            with processed_lock:
+                processed.append(event.id)
+        outbox.handler('order.placed')(record)
+        self.addCleanup(outbox._handlers.clear)
+        for i in range(self.events):
+            outbox.publish('order.placed', {'order_ids': [i]})
+
+        start = threading.Barrier(self.workers)
+
+        def work(worker_id):
+            start.wait()
+            try:
+                outbox.drain(worker_id, batch_size=5)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(f'worker-{i}',)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(processed), sorted(OutboxEvent.objects.values_list('id', flat=True)))
+        self.assertFalse(OutboxEvent.objects.exclude(status='Done').exists())
+
+
+class IdempotencyKeyTests(TestCase):
+
+    def setUp(self):
+        self.food_item = make_food_item()
+        self.customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.addCleanup(cache.clear)
+
+    def add_to_cart(self, key, food_item_id=None):
+        return self.client.post('/api/cart/add/', {'food_item_id': food_item_id or self.food_item.id},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeated_key_replays_without_rerunning_the_view(self):
+        first = self.add_to_cart('retry-1')
+        second = self.add_to_cart('retry-1')
+
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_replay_falls_back_to_the_database(self):
+        self.add_to_cart('retry-1')
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            response = self.add_to_cart('retry-1')
+
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client.post('/api/cart/add/', {'food_item_id': self.food_item.id}, format='json')
+        self.client.post('/api/cart/add/', {'food_item_id': self.food_item.id}, format='json')
+
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_key_reused_for_a_different_body_is_rejected(self):
+        other_item = make_food_item(name='Greek Salad')
+        self.add_to_cart('retry-1')
+
+        response = self.add_to_cart('retry-1', food_item_id=other_item.id)
+
+        self.assertEqual(response.status_code, 422)
+
+    def test_keys_are_scoped_per_user(self):
+        self.add_to_cart('retry-1')
+        other = User.objects.create_user(username='other', password='secret-pass-123')
+        self.client.force_authenticate(other)
+
+        self.add_to_cart('retry-1')
+
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_expired_keys_run_the_view_again_and_are_purged(self):
+        self.add_to_cart('retry-1')
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        cache.clear()
+
+        self.add_to_cart('retry-1')
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_expired(), 1)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_retry_takes_over_a_record_stranded_by_a_dead_worker(self):
+        self.add_to_cart('retry-1')
+        # What a worker killed mid-request leaves behind
+        IdempotencyRecord.objects.update(status_code=None, response_body=None, locked_until=timezone.now())
+        CartItem.objects.all().delete()
+        cache.clear()
+
+        response = self.add_to_cart('retry-1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        self.assertIsNotNone(IdempotencyRecord.objects.get().status_code)
+
+    def test_in_flight_record_within_its_lease_is_a_conflict(self):
+        self.add_to_cart('retry-1')
+        IdempotencyRecord.objects.update(status_code=None, response_body=None,
+                                         locked_until=timezone.now() + timedelta(seconds=30))
+        cache.clear()
+
+        self.assertEqual(self.add_to_cart('retry-1').status_code, 409)
+
+    def test_retry_with_reordered_json_keys_is_replayed(self):
+        first = self.client.post('/api/cart/add/', f'{{"food_item_id": {self.food_item.id}, "note": "x"}}',
+                                 content_type='application/json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        second = self.client.post('/api/cart/add/', f'{{"note": "x",  "food_item_id": {self.food_item.id}}}',
+                                  content_type='application/json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+
+class IdempotencyKeyConcurrencyTests(TransactionTestCase):
+    clients = 8
+
+    def test_simultaneous_duplicate_checkouts_place_one_order(self):
+        food_item = make_food_item()
+        customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        cart = Cart.objects.create(user=customer)
+        CartItem.objects.create(cart=cart, food_item=food_item)
+        self.addCleanup(cache.clear)
+
+        statuses = []
+        statuses_lock = threading.Lock()
+        start = threading.Barrier(self.clients)
+
+        def checkout():
+            client = APIClient()
+            client.force_authenticate(customer)
+            start.wait()
+            try:
+                response = client.post('/api/place_order/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+                with statuses_lock:
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(self.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(len(statuses), self.clients)
+        self.assertTrue(set(statuses) <= {200, 409})
+        self.assertIn(200, statuses)
+        # Once the first request has finished, every retry is a replay
+        client = APIClient()
+        client.force_authenticate(customer)
+        self.assertEqual(client.post('/api/place_order/', HTTP_IDEMPOTENCY_KEY='checkout-1').status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class CustomerOrderHistoryTests(TestCase):
+
+    def setUp(self):
+        self.food_item = make_food_item()
+        self.customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def place_orders(self, count):
+        return [Order.objects.create(customer_name='customer', food_item=self.food_item) for _ in range(count)]
+
+    def test_history_is_paginated(self):
+        self.place_orders(5)
+        Order.objects.create(customer_name='someone-else', food_item=self.food_item)
+
+        response = self.client.get('/api/my_orders/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_unchanged_history_returns_304_for_etag(self):
+        self.place_orders(2)
+        response = self.client.get('/api/my_orders/')
+
+        by_etag = self.client.get('/api/my_orders/', HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertIn('Last-Modified', response)
+
+    def test_etag_changes_when_an_order_changes(self):
+        order, = self.place_orders(1)
+        etag = self.client.get('/api/my_orders/')['ETag']
+
+        order.delivery_status = 'Delivered'
+        order.save()
+        response = self.client.get('/api/my_orders/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_since_returns_only_changed_orders_and_tombstones(self):
+        kept, changed, deleted = self.place_orders(3)
+        Order.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        Order.objects.filter(id=kept.id).update(updated_at=timezone.now() - timedelta(hours=2))
+        since = self.client.get('/api/my_orders/?since=2000-01-01T00:00:00Z').data['last_modified']
+
+        deleted_id = deleted.id
+        Order.objects.filter(id=changed.id).update(delivery_status='Delivered', updated_at=timezone.now())
+        deleted.delete()
+        response = self.client.get('/api/my_orders/', {'since': since.isoformat()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['id'] for order in response.data['results']], [changed.id])
+        self.assertEqual(response.data['deleted'], [deleted_id])
+
+    def test_since_rereads_orders_committed_after_the_last_sync(self):
+        order, = self.place_orders(1)
+        since = timezone.now()
+        # Written before the client's last sync, but only committed after it
+        Order.objects.filter(id=order.id).update(updated_at=since - timedelta(seconds=5))
+
+        response = self.client.get('/api/my_orders/', {'since': since.isoformat()})
+
+        self.assertEqual([row['id'] for row in response.data['results']], [order.id])
+
+    def test_since_is_paginated(self):
+        self.place_orders(5)
+
+        response = self.client.get('/api/my_orders/', {'since': '2000-01-01T00:00:00Z'})
+        next_page = self.client.get(response.data['next'])
+
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(len(next_page.data['results']), 2)
+        self.assertEqual(next_page.data['last_modified'], response.data['last_modified'])
+
+    def test_change_within_the_same_second_is_not_a_304_for_if_modified_since(self):
+        order, = self.place_orders(1)
+        Order.objects.filter(id=order.id).update(updated_at=timezone.now().replace(microsecond=100000))
+        last_modified = self.client.get('/api/my_orders/')['Last-Modified']
+
+        Order.objects.filter(id=order.id).update(updated_at=timezone.now().replace(microsecond=900000),
+                                                 delivery_status='Delivered')
+        response = self.client.get('/api/my_orders/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_an_order_leaves_a_tombstone(self):
+        order, = self.place_orders(1)
+        order_id = order.id
+
+        order.delete()
+
+        self.assertTrue(OrderTombstone.objects.filter(order_id=order_id, customer_name='customer').exists())
+
+    def test_invalid_since_is_rejected(self):
+        response = self.client.get('/api/my_orders/', {'since': 'yesterday'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_impossible_since_date_is_rejected(self):
+        response = self.client.get('/api/my_orders/', {'since': '2024-02-30T00:00:00'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TOKEN_BUCKET_THROTTLE={
+    'STORE': 'LittleLemonAPI.throttling.LocMemBucketStore',
+    'RATES': {
+        'auth': {'burst': 2, 'refill_rate': 0.5},
+        'cart': {'burst': 3, 'refill_rate': 0.01},
+    },
+})
+class TokenBucketThrottleTests(TestCase):
+
+    def setUp(self):
+        throttling.get_store().clear()
+        self.food_item = make_food_item()
+        self.customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def add_to_cart(self):
+        return self.client.post('/api/cart/add/', {'food_item_id': self.food_item.id}, format='json')
+
+    def test_burst_is_allowed_then_throttled_with_retry_after(self):
+        statuses = [self.add_to_cart().status_code for _ in range(3)]
+        throttled = self.add_to_cart()
+
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(int(throttled['Retry-After']), 100)
+
+    def test_buckets_are_per_user(self):
+        for _ in range(3):
+            self.add_to_cart()
+        other = User.objects.create_user(username='other', password='secret-pass-123')
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.add_to_cart().status_code, 200)
+
+    def test_route_classes_have_separate_buckets(self):
+        for _ in range(4):
+            self.add_to_cart()
+
+        response = self.client.get('/api/my_orders/')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_anonymous_requests_are_bucketed_by_ip(self):
+        anonymous = APIClient()
+        for _ in range(2):
+            anonymous.post('/api/token/', {'username': 'customer', 'password': 'wrong'}, REMOTE_ADDR='10.0.0.1')
+
+        throttled = anonymous.post('/api/token/', {'username': 'customer', 'password': 'wrong'}, REMOTE_ADDR='10.0.0.1')
+        other_ip = anonymous.post('/api/token/', {'username': 'customer', 'password': 'wrong'}, REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(other_ip.status_code, 401)
+
+    def test_counters_record_allowed_and_throttled_requests(self):
+        before = throttling.throttle_counters()
+        for _ in range(4):
+            self.add_to_cart()
+        after = throttling.throttle_counters()
+
+        self.assertEqual(after['cart.allowed'] - before.get('cart.allowed', 0), 3)
+        self.assertEqual(after['cart.throttled'] - before.get('cart.throttled', 0), 1)
+
+    def test_counters_are_logged_periodically(self):
+        with override_settings(TOKEN_BUCKET_THROTTLE={**settings.TOKEN_BUCKET_THROTTLE, 'COUNTER_LOG_INTERVAL': 0}):
+            with self.assertLogs('LittleLemonAPI.throttling', 'INFO') as logs:
+                self.add_to_cart()
+
+        self.assertIn("'cart.allowed'", logs.output[-1])
+
+
+class BucketStoreTests(TestCase):
+
+    def test_locmem_bucket_refills_over_time(self):
+        store = throttling.LocMemBucketStore()
+        with mock.patch('LittleLemonAPI.throttling.time.monotonic', return_value=100.0):
+            self.assertEqual(store.take('k', 1, 2), (True, 0))
+            allowed, wait = store.take('k', 1, 2)
+        self.assertFalse(allowed)
+        self.assertEqual(wait, 0.5)
+
+        with mock.patch('LittleLemonAPI.throttling.time.monotonic', return_value=100.5):
+            self.assertEqual(store.take('k', 1, 2), (True, 0))
+
+    def test_locmem_sweeps_full_buckets(self):
+        store = throttling.LocMemBucketStore(max_buckets=2)
+        with mock.patch('LittleLemonAPI.throttling.time.monotonic', return_value=100.0):
+            store.take('a', 1, 1)
+            store.take('b', 1, 1)
+        with mock.patch('LittleLemonAPI.throttling.time.monotonic', return_value=200.0):
+            store.take('c', 1, 1)
+
+        self.assertEqual(set(store._buckets), {'c'})
+
+    def test_cache_store_limits_each_window_to_the_burst(self):
+        store = throttling.CacheBucketStore()
+        self.addCleanup(cache.clear)
+        with mock.patch('LittleLemonAPI.throttling.time.time', return_value=1000.0):
+            results = [store.take('k', 2, 1) for _ in range(3)]
+
+        self.assertEqual([allowed for allowed, _ in results], [True, True, False])
+        self.assertEqual(results[-1][1], 2.0)
+
+    def test_cache_store_does_not_allow_a_second_burst_across_a_window_edge(self):
+        store = throttling.CacheBucketStore()
+        self.addCleanup(cache.clear)
+        with mock.patch('LittleLemonAPI.throttling.time.time', return_value=1001.9):
+            store.take('k', 2, 1)
+            store.take('k', 2, 1)
+        with mock.patch('LittleLemonAPI.throttling.time.time', return_value=1002.1):
+            allowed, wait = store.take('k', 2, 1)
+        with mock.patch('LittleLemonAPI.throttling.time.time', return_value=1003.0):
+            self.assertEqual(store.take('k', 2, 1), (True, 0))
+
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.9)
+
+    def test_store_starts_empty_when_settings_change(self):
+        store = throttling.get_store()
+        store.take('k', 1, 0.01)
+
+        with override_settings(TOKEN_BUCKET_THROTTLE={'STORE': 'LittleLemonAPI.throttling.LocMemBucketStore',
+                                                      'RATES': {}}):
+            self.assertIsNot(throttling.get_store(), store)
+            self.assertEqual(throttling.get_store().take('k', 1, 0.01), (True, 0))
+
+
+class ApiSettingsProfileTests(TransactionTestCase):
+    # Committed rows, because the probes read the test database from other processes
+
+    def test_api_profile_serves_requests_like_the_full_profile(self):
+        make_food_item()
+        token = str(AccessToken.for_user(User.objects.create_user(username='customer', password='secret-pass-123')))
+        command = BenchmarkStartupCommand()
+
+        full = command.measure('LittleLemon.settings', '/api/food-items/', token)
+        api_only = command.measure('LittleLemon.settings_api', '/api/food-items/', token)
+
+        self.assertEqual(full['status'], '200 OK')
+        self.assertEqual(api_only['status'], '200 OK')
+        self.assertLess(api_only['modules'], full['modules'])
+
+    def test_benchmark_needs_a_user(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_startup', runs=1, stdout=StringIO())
+
+
+class LocationInventoryTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.downtown = Location.objects.create(name='Downtown')
+        self.uptown = Location.objects.create(name='Uptown')
+        self.cake = make_food_item()
+        self.salad = make_food_item(name='Greek Salad')
+        LocationStock.objects.create(location=self.downtown, food_item=self.cake, stock=2)
+        LocationStock.objects.create(location=self.downtown, food_item=self.salad, stock=0)
+        LocationStock.objects.create(location=self.uptown, food_item=self.salad, stock=5)
+        self.customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        self.cart = Cart.objects.create(user=self.customer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def stock(self, location, food_item):
+        return LocationStock.objects.get(location=location, food_item=food_item).stock
+
+    def test_checkout_reserves_stock_at_the_location(self):
+        CartItem.objects.create(cart=self.cart, food_item=self.cake, quantity=2)
+
+        response = self.client.post('/api/place_order/', {'location_id': self.downtown.id}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(self.downtown, self.cake), 0)
+        self.assertEqual(Order.objects.get().location, self.downtown)
+
+    def test_sold_out_items_fail_checkout_before_any_order_is_created(self):
+        CartItem.objects.create(cart=self.cart, food_item=self.cake, quantity=1)
+        CartItem.objects.create(cart=self.cart, food_item=self.salad, quantity=1)
+
+        response = self.client.post('/api/place_order/', {'location_id': self.downtown.id}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['sold_out'], [self.salad.id])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(self.downtown, self.cake), 2)
+        self.assertEqual(self.cart.cart_items.count(), 2)
+
+    def test_items_not_on_the_location_menu_are_sold_out(self):
+        CartItem.objects.create(cart=self.cart, food_item=self.cake, quantity=1)
+
+        response = self.client.post('/api/place_order/', {'location_id': self.uptown.id}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+
+    def test_unknown_location_is_rejected(self):
+        CartItem.objects.create(cart=self.cart, food_item=self.cake, quantity=1)
+
+        response = self.client.post('/api/place_order/', {'location_id': 999}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_checkout_requires_a_location_once_locations_exist(self):
+        CartItem.objects.create(cart=self.cart, food_item=self.cake, quantity=1)
+
+        response = self.client.post('/api/place_order/', {}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_malformed_location_ids_are_rejected(self):
+        CartItem.objects.create(cart=self.cart, food_item=self.cake, quantity=1)
+
+        for location_id in ['\u00b2', '99999999999999999999', '0', '-1', '1.5']:
+            checkout = self.client.post('/api/place_order/', {'location_id': location_id}, format='json')
+            menu = self.client.get('/api/food-items/', {'location': location_id})
+
+            self.assertEqual(checkout.status_code, 400, location_id)
+            self.assertEqual(menu.status_code, 400, location_id)
+        for location_id in [99999999999999999999, True, [1]]:
+            checkout = self.client.post('/api/place_order/', {'location_id': location_id}, format='json')
+            self.assertEqual(checkout.status_code, 400, location_id)
+        self.assertFalse(Order.objects.exists())
+
+    def test_menu_lists_location_items_with_stock(self):
+        response = self.client.get('/api/food-items/', {'location': self.downtown.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['name']: item['stock'] for item in response.data['results']},
+                         {'Lemon Cake': 2, 'Greek Salad': 0})
+
+    def test_menu_query_count_does_not_grow_with_items(self):
+        # With the availability map cached: one count and one page query
+        self.client.get('/api/food-items/', {'location': self.downtown.id})
+        with self.assertNumQueries(2):
+            self.client.get('/api/food-items/', {'location': self.downtown.id})
+
+        for i in range(3):
+            LocationStock.objects.create(location=self.downtown, food_item=make_food_item(name=f'Special {i}'), stock=1)
+        cache.clear()
+        self.client.get('/api/food-items/', {'location': self.downtown.id})
+        with self.assertNumQueries(2):
+            self.client.get('/api/food-items/', {'location': self.downtown.id})
+
+    def test_checkout_invalidates_cached_availability(self):
+        self.client.get('/api/food-items/', {'location': self.downtown.id})
+        CartItem.objects.create(cart=self.cart, food_item=self.cake, quantity=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/place_order/', {'location_id': self.downtown.id}, format='json')
+        response = self.client.get('/api/food-items/', {'location': self.downtown.id})
+
+        self.assertEqual({item['name']: item['stock'] for item in response.data['results']}['Lemon Cake'], 1)
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    customers = 8
+    stock = 3
+
+    def test_parallel_checkouts_never_oversell(self):
+        self.addCleanup(cache.clear)
+        location = Location.objects.create(name='Downtown')
+        food_item = make_food_item()
+        LocationStock.objects.create(location=location, food_item=food_item, stock=self.stock)
+        customers = [User.objects.create_user(username=f'customer-{i}', password='secret-pass-123')
+                     for i in range(self.customers)]
+        for customer in customers:
+            CartItem.objects.create(cart=Cart.objects.create(user=customer), food_item=food_item)
+
+        statuses = []
+        statuses_lock = threading.Lock()
+        start = threading.Barrier(self.customers)
+
+        def checkout(customer):
+            client = APIClient()
+            client.force_authenticate(customer)
+            start.wait()
+            try:
+                response = client.post('/api/place_order/', {'location_id': location.id}, format='json')
+                with statuses_lock:
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(customer,)) for customer in customers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(200), self.stock)
+        self.assertEqual(statuses.count(409), self.customers - self.stock)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(LocationStock.objects.get().stock, 0)
+
+
+class OrderArchiveTests(TestCase):
+
+    def setUp(self):
+        self.food_item = make_food_item()
+        self.customer = User.objects.create_user(username='customer', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.long_ago = timezone.now() - timedelta(days=120)
+
+    def make_order(self, delivery_status='Delivered', updated_at=None):
+        order = Order.objects.create(customer_name='customer', food_item=self.food_item, delivery_status=delivery_status)
+        Order.objects.filter(id=order.id).update(updated_at=updated_at or self.long_ago)
+        return order
+
+    def test_only_old_delivered_orders_are_archived(self):
+        old_delivered = self.make_order()
+        old_pending = self.make_order(delivery_status='Pending')
+        recent_delivered = self.make_order(updated_at=timezone.now())
+
+        stats = archive_delivered_orders(timedelta(days=90))
+
+        self.assertEqual(stats.rows, 1)
+        self.assertEqual(list(ArchivedOrder.objects.values_list('id', flat=True)), [old_delivered.id])
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {old_pending.id, recent_delivered.id})
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.customer_name, archived.food_item_id, archived.updated_at),
+                         ('customer', self.food_item.id, self.long_ago))
+
+    def test_archiving_runs_in_bounded_batches(self):
+        for _ in range(5):
+            self.make_order()
+
+        stats = archive_delivered_orders(timedelta(days=90), batch_size=2)
+
+        self.assertEqual((stats.rows, stats.batches), (5, 3))
+        self.assertFalse(Order.objects.exists())
+
+    def test_max_batches_stops_early(self):
+        for _ in range(5):
+            self.make_order()
+
+        stats = archive_delivered_orders(timedelta(days=90), batch_size=2, max_batches=1)
+
+        self.assertEqual(stats.rows, 2)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_archiving_leaves_no_tombstones(self):
+        self.make_order()
+
+        archive_delivered_orders(timedelta(days=90))
+
+        self.assertFalse(OrderTombstone.objects.exists())
+
+    def test_archived_orders_stay_in_history_with_the_same_etag(self):
+        archived = self.make_order()
+        current = self.make_order(delivery_status='Pending', updated_at=timezone.now())
+        before = self.client.get('/api/my_orders/')
+
+        archive_delivered_orders(timedelta(days=90))
+        after = self.client.get('/api/my_orders/', HTTP_IF_NONE_MATCH=before['ETag'])
+        full = self.client.get('/api/my_orders/')
+
+        self.assertEqual(after.status_code, 304)
+        self.assertEqual([order['id'] for order in full.data['results']], [archived.id, current.id])
+        self.assertEqual(full.data['results'], before.data['results'])
+
+    def test_delta_sync_includes_archived_orders(self):
+        archived = self.make_order()
+        archive_delivered_orders(timedelta(days=90))
+
+        response = self.client.get('/api/my_orders/', {'since': (self.long_ago - timedelta(days=1)).isoformat()})
+
+        self.assertEqual([order['id'] for order in response.data['results']], [archived.id])
+
+    def test_customers_still_see_archived_orders_on_the_orders_endpoint(self):
+        self.customer.groups.add(Group.objects.create(name='Customer'))
+        archived = self.make_order()
+        current = self.make_order(delivery_status='Pending', updated_at=timezone.now())
+        before = self.client.get('/api/orders/')
+
+        archive_delivered_orders(timedelta(days=90))
+        listed = self.client.get('/api/orders/')
+        detail = self.client.get(f'/api/orders/{archived.id}/')
+
+        self.assertEqual([order['id'] for order in listed.data['results']], [archived.id, current.id])
+        self.assertEqual(listed.data['results'], before.data['results'])
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(detail.data['delivery_status'], 'Delivered')
+        self.assertEqual(self.client.get('/api/orders/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/orders/nope/').status_code, 404)
+
+    def test_deleting_an_archived_order_leaves_a_tombstone(self):
+        archived = self.make_order()
+        archive_delivered_orders(timedelta(days=90))
+        since = timezone.now()
+
+        self.food_item.delete()
+        response = self.client.get('/api/my_orders/', {'since': since.isoformat()})
+
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self.assertEqual(response.data['deleted'], [archived.id])
+
+    def test_command_reports_throughput_and_lock_time(self):
+        self.make_order()
+        out = StringIO()
+
+        call_command('archive_orders', '--days', '90', stdout=out)
+
+        self.assertIn('Archived 1 order(s) in 1 batch(es)', out.getvalue())
+        self.assertIn('rows/s, lock time', out.getvalue())
@@ -0,0 +1,197 @@
+"""
+Token bucket throttling keyed by route class and by user (or client IP).
+
+Each route class ("auth", "cart", "menu", "orders") has its own burst size and
+refill rate in ``settings.TOKEN_BUCKET_THROTTLE``. Buckets live in a pluggable
+store: ``CacheBucketStore`` shares them between workers through atomic
+increments on a Django cache such as Redis, and ``LocMemBucketStore`` keeps
+them in process memory behind a lock, which suits tests and single-process
+deployments. Each worker logs its allowed/throttled counts periodically.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+
+class LocMemBucketStore:
+    """
+    Exact token buckets held in this process.
+
+    Buckets that have refilled completely carry no information, so they are
+    swept once the store grows past ``max_buckets`` to bound memory.
+    """
+
+    def __init__(self, max_buckets=10000):
+        self.max_buckets = max_buckets
+        self._sweep_at = max_buckets
+        # key -> (tokens, last update, time the bucket will be full again)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, refill_rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / refill_rate)
+            if len(self._buckets) > self._sweep_at:
+                self._sweep(now)
+        return (True, 0) if allowed else (False, (1 - tokens) / refill_rate)
+
+    def _sweep(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._sweep_at = max(self.max_buckets, 2 * len(self._buckets))
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Buckets shared between workers through a Django cache.
+
+    Caches only offer atomic add/incr, not compare-and-set, so each bucket is
+    approximated by a sliding window of ``burst / refill_rate`` seconds: the
+    count for the current window plus the previous window's count, weighted
+    by how much of it the sliding window still covers, may not exceed
+    ``burst``. Unlike fixed windows this does not let 2x ``burst`` through
+    around a window edge, but it is an approximation: it assumes the previous
+    window's requests were spread evenly.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def take(self, key, burst, refill_rate):
+        window = burst / refill_rate
+        window_index, offset = divmod(time.time(), window)
+        window_index = int(window_index)
+        counter_key = f'throttle:{key}:{window_index}'
+        # Kept for two windows, since the next window weighs it in too
+        timeout = math.ceil(2 * window) + 1
+        self.cache.add(counter_key, 0, timeout=timeout)
+        try:
+            used = self.cache.incr(counter_key)
+        except ValueError:
+            # Evicted between add() and incr(); start the window again
+            self.cache.add(counter_key, 1, timeout=timeout)
+            used = 1
+
+        previous = self.cache.get(f'throttle:{key}:{window_index - 1}', 0)
+        if previous * (1 - offset / window) + used <= burst:
+            return True, 0
+
+        # Rejected requests do not count against the window
+        try:
+            self.cache.decr(counter_key)
+        except ValueError:
+            pass
+        if used > burst:
+            return False, window - offset
+        # Wait until enough of the previous window has slid out
+        return False, window * (1 - (burst - used) / previous) - offset
+
+
+_store = None
+_counters = Counter()
+_counters_lock = threading.Lock()
+_counters_logged_at = time.monotonic()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.TOKEN_BUCKET_THROTTLE['STORE'])()
+    return _store
+
+
+def throttle_counters():
+    """
+    Snapshot of allowed/throttled request counts per route class in this process.
+    """
+    with _counters_lock:
+        return dict(_counters)
+
+
+def _count(scope, allowed):
+    # Counts are cumulative per process; whatever collects the logs sums the
+    # latest line of each worker
+    global _counters_logged_at
+    snapshot = None
+    now = time.monotonic()
+    with _counters_lock:
+        _counters[f'{scope}.{"allowed" if allowed else "throttled"}'] += 1
+        if now - _counters_logged_at >= settings.TOKEN_BUCKET_THROTTLE.get('COUNTER_LOG_INTERVAL', 60):
+            _counters_logged_at = now
+            snapshot = dict(_counters)
+    if snapshot is not None:
+        logger.info("Throttle counters for worker %s: %s", os.getpid(), snapshot)
+
+
+@receiver(setting_changed)
+def reload_throttle_settings(setting, **kwargs):
+    global _store
+    if setting == 'TOKEN_BUCKET_THROTTLE':
+        _store = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle requests per route class using the configured bucket store.
+
+    Authenticated requests are bucketed per user, anonymous ones per client
+    IP. Subclasses set ``scope`` to the route class they guard.
+    """
+    scope = None
+
+    def allow_request(self, request, view):
+        rate = settings.TOKEN_BUCKET_THROTTLE['RATES'].get(self.scope)
+        if rate is None:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+
+        allowed, self._wait = get_store().take(f'{self.scope}:{ident}', rate['burst'], rate['refill_rate'])
+        _count(self.scope, allowed)
+        if not allowed:
+            logger.info("Throttled %s request from %s; retry in %.1fs", self.scope, ident, self._wait)
+        return allowed
+
+    def wait(self):
+        # DRF sends this as the Retry-After header; round up so clients never retry early
+        return math.ceil(self._wait)
+
+
+class AuthRateThrottle(TokenBucketThrottle):
+    scope = 'auth'
+
+
+class CartRateThrottle(TokenBucketThrottle):
+    scope = 'cart'
+
+
+class MenuRateThrottle(TokenBucketThrottle):
+    scope = 'menu'
+
+
+class OrdersRateThrottle(TokenBucketThrottle):
+    scope = 'orders'
@@ -1,28 +1,75 @@
+import hashlib
+import math
+
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets, permissions, generics, status
-from rest_framework.decorators import api_view, permission_classes, action
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from rest_framework import viewsets, permissions, generics, serializers, status
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import FoodItem, Order, Category, Cart, CartItem
-from .serializers import FoodItemSerializer, OrderSerializer, CategorySerializer, UserRegistrationSerializer, CartItemSerializer
+from .models import FoodItem, Order, ArchivedOrder, OrderTombstone, Category, Cart, CartItem, Location
+from .serializers import FoodItemSerializer, LocationFoodItemSerializer, LocationSerializer, OrderSerializer, OrderHistorySerializer, CategorySerializer, UserRegistrationSerializer, CartItemSerializer
 from .permissions import IsManager, IsDeliveryCrew
-from rest_framework.exceptions import PermissionDenied
+from . import inventory, outbox
+from .idempotency import idempotent
+from .throttling import AuthRateThrottle, CartRateThrottle, MenuRateThrottle, OrdersRateThrottle
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework import filters
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from django.contrib.auth import authenticate
 
 
+# Location ids from query strings and request bodies; anything outside a
+# 64-bit primary key is rejected here rather than by the database driver
+location_id_field = serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1)
+
+
 class FoodItemViewSet(viewsets.ModelViewSet):
     queryset = FoodItem.objects.all()
     serializer_class = FoodItemSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthenticated]
+    throttle_classes = [MenuRateThrottle]
     filter_backends = [filters.SearchFilter]
     search_fields = ['category__name']
 
     def get_queryset(self):
-        return FoodItem.objects.all()
+        stock = self.location_stock()
+        if stock is None:
+            return FoodItem.objects.all()
+        return FoodItem.objects.filter(id__in=stock).order_by('id')
+
+    def location_stock(self):
+        # ?location=<id> narrows the menu to one location and adds its stock
+        location_id = self.request.query_params.get('location')
+        if location_id is None:
+            return None
+        try:
+            location_id = location_id_field.run_validation(location_id)
+        except ValidationError:
+            raise ValidationError({"location": "Must be a location id."})
+        if not hasattr(self, '_location_stock'):
+            self._location_stock = inventory.availability(location_id)
+        return self._location_stock
+
+    def get_serializer_class(self):
+        if self.request.query_params.get('location') is not None:
+            return LocationFoodItemSerializer
+        return FoodItemSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.query_params.get('location') is not None:
+            context['stock'] = self.location_stock()
+        return context
 
     def perform_update(self, serializer):
         if 'is_item_of_the_day' in self.request.data:
@@ -31,18 +78,91 @@ class FoodItemViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
+def claim_next_order(user):
+    """
+    Atomically assign the oldest unassigned pending order to the given crew member.
+
+    Backends with row locks use SELECT ... FOR UPDATE SKIP LOCKED so parallel
+    claimers never block on, or grab, the same row. SQLite has no row locks, so
+    there each candidate is claimed with a conditional UPDATE that only succeeds
+    while the order is still pending and unassigned. Returns None when nothing is pending.
+    """
+    pending = Order.objects.filter(delivery_status='Pending', delivery_crew_member__isnull=True).order_by('id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            order = pending.select_for_update(skip_locked=True).first()
+            if order is not None:
+                order.delivery_crew_member = user
+                order.save(update_fields=['delivery_crew_member', 'updated_at'])
+            return order
+
+    while True:
+        candidate_ids = list(pending.values_list('id', flat=True)[:10])
+        if not candidate_ids:
+            return None
+        for order_id in candidate_ids:
+            # Both conditions are re-checked, so an order assigned or delivered
+            # since the candidates were read is skipped
+            claimed = pending.filter(id=order_id).update(delivery_crew_member=user, updated_at=timezone.now())
+            if claimed:
+                return Order.objects.get(id=order_id)
+
+
+def order_history(customer_name, **filters):
+    """
+    A customer's hot and archived orders as one id-ordered queryset of row dicts.
+
+    Render rows with ``OrderHistorySerializer``. Union querysets cannot be
+    filtered further, so pass any filters here.
+    """
+    columns = ['id', 'customer_name', 'food_item_id', 'delivery_status', 'delivery_crew_member_id',
+               'location_id', 'updated_at']
+    orders = Order.objects.filter(customer_name=customer_name, **filters).values(*columns)
+    archived = ArchivedOrder.objects.filter(customer_name=customer_name, **filters).values(*columns)
+    return orders.union(archived, all=True).order_by('id')
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [OrdersRateThrottle]
     
     def get_queryset(self):
         user = self.request.user
-        if user.groups.filter(name='DeliveryCrew').exists():
-            return Order.objects.filter(delivery_crew_member=user)
+        if user.groups.filter(name='Delivery Crew').exists():
+            return Order.objects.filter(delivery_crew_member=user).order_by('id')
         elif user.groups.filter(name='Customer').exists():
-            return Order.objects.filter(customer_name=user.username)
+            if self.reads_history():
+                return order_history(user.username)
+            return Order.objects.filter(customer_name=user.username).order_by('id')
         return Order.objects.none()
 
+    def reads_history(self):
+        # Customers read archived orders too; they stay read-only history, so
+        # everything else only ever sees live orders
+        user = self.request.user
+        return (self.action in ('list', 'retrieve')
+                and not user.groups.filter(name='Delivery Crew').exists()
+                and user.groups.filter(name='Customer').exists())
+
+    def get_serializer_class(self):
+        if self.reads_history():
+            return OrderHistorySerializer
+        return OrderSerializer
+
+    def get_object(self):
+        if not self.reads_history():
+            return super().get_object()
+        try:
+            order = order_history(self.request.user.username, id=self.kwargs['pk']).first()
+        except (TypeError, ValueError, OverflowError):
+            order = None
+        if order is None:
+            raise Http404
+        self.check_object_permissions(self.request, order)
+        return order
+
     def perform_update(self, serializer):
         # Only allow managers to assign orders to delivery crew members
         if 'delivery_crew_member' in self.request.data:
@@ -64,15 +184,54 @@ class OrderViewSet(viewsets.ModelViewSet):
         if order.delivery_crew_member != request.user:
             return Response({"detail": "Order not assigned to you."}, status=status.HTTP_403_FORBIDDEN)
 
-        order.delivery_status = 'Delivered'
-        order.save()
+        with transaction.atomic():
+            order.delivery_status = 'Delivered'
+            order.save()
+            outbox.publish('order.delivered', {'order_ids': [order.id]}, idempotency_key=f'order.delivered:{order.id}')
         return Response({"message": f"Order {order.id} marked as delivered."}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['POST'], permission_classes=[IsDeliveryCrew], url_path='claim-next')
+    def claim_next(self, request):
+        order = claim_next_order(request.user)
+        if order is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['POST'], permission_classes=[IsDeliveryCrew], url_path='mark-delivered')
+    def mark_many_as_delivered(self, request):
+        raw_order_ids = request.data.get('order_ids')
+        try:
+            # Strings and dicts are iterable too, so only a real list is accepted
+            order_ids = [int(order_id) for order_id in raw_order_ids] if isinstance(raw_order_ids, list) else []
+        except (TypeError, ValueError):
+            order_ids = []
+        if not order_ids:
+            return Response({"error": "order_ids must be a non-empty list of order ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only orders assigned to the current crew member and still pending are touched
+        with transaction.atomic():
+            orders = Order.objects.filter(id__in=order_ids, delivery_crew_member=request.user, delivery_status='Pending')
+            delivered_ids = list(orders.select_for_update().values_list('id', flat=True))
+            Order.objects.filter(id__in=delivered_ids).update(delivery_status='Delivered', updated_at=timezone.now())
+            for order_id in delivered_ids:
+                outbox.publish('order.delivered', {'order_ids': [order_id]}, idempotency_key=f'order.delivered:{order_id}')
+
+        skipped_ids = [order_id for order_id in order_ids if order_id not in delivered_ids]
+        return Response({"delivered": delivered_ids, "skipped": skipped_ids}, status=status.HTTP_200_OK)
+
+
+class LocationViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Location.objects.order_by('id')
+    serializer_class = LocationSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [MenuRateThrottle]
+
 
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [MenuRateThrottle]
 
     def create(self, request, *args, **kwargs):
         if not request.user.is_staff or not request.user.is_superuser:
@@ -80,6 +239,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 @api_view(['POST',])
+@throttle_classes([AuthRateThrottle])
 def registration_view(request):
     if request.method == 'POST':
         serializer = UserRegistrationSerializer(data=request.data)
@@ -94,6 +254,7 @@ def registration_view(request):
 
 class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
+    throttle_classes = [AuthRateThrottle]
     def create(self, request, *args, **kwargs):
         response = super(UserRegistrationView, self).create(request, *args, **kwargs)
         return Response({
@@ -109,7 +270,7 @@ class UserManagerViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], url_path='assign-to-delivery-crew')
     def assign_to_delivery_crew(self, request, pk=None):
         user = self.get_object()
-        delivery_crew_group, _ = Group.objects.get_or_create(name='DeliveryCrew')
+        delivery_crew_group, _ = Group.objects.get_or_create(name='Delivery Crew')
         user.groups.add(delivery_crew_group)
         user.save()
         return Response({"message": f"{user.username} has been added to the delivery crew."}, status=status.HTTP_200_OK)
@@ -136,12 +297,14 @@ def assign_to_delivery_crew(request):
     except User.DoesNotExist:
         return Response({"error": "User not found"}, status=400)
 
-    delivery_crew_group, created = Group.objects.get_or_create(name="DeliveryCrew")
+    delivery_crew_group, created = Group.objects.get_or_create(name="Delivery Crew")
     user.groups.add(delivery_crew_group)
     return Response({"message": f"{user.username} has been assigned to the delivery crew."})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([CartRateThrottle])
+@idempotent
 def add_item_to_cart(request):
     # Check if user has a cart, if not create one
     cart, created = Cart.objects.get_or_create(user=request.user)
@@ -163,6 +326,7 @@ def add_item_to_cart(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([CartRateThrottle])
 def get_cart_items(request):
     try:
         cart = request.user.cart
@@ -174,6 +338,7 @@ def get_cart_items(request):
     
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
 
     def post(self, request):
         username = request.data.get("username")
@@ -190,26 +355,125 @@ class LoginView(APIView):
 
 class PlaceOrderView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [OrdersRateThrottle]
 
+    @idempotent
     def post(self, request):
         cart = get_object_or_404(Cart, user=request.user)
-        cart_items = cart.cart_items.all()
+        cart_items = cart.cart_items.select_related('food_item')
         if not cart_items:
             return Response({"error": "Your cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
-        for cart_item in cart_items:
-            Order.objects.create(
-                customer_name=request.user.username,
-                food_item=cart_item.food_item,
-                delivery_status='Pending'
-            )
-        cart.cart_items.clear()
+
+        # Stock is only tracked per location, so once any location exists every
+        # order has to name one; without locations orders are not stock-checked
+        location = None
+        location_id = request.data.get('location_id')
+        if location_id is None:
+            if Location.objects.exists():
+                return Response({"error": "location_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            try:
+                location_id = location_id_field.run_validation(location_id)
+            except ValidationError:
+                return Response({"error": "location_id must be a location id."}, status=status.HTTP_400_BAD_REQUEST)
+            location = Location.objects.filter(id=location_id).first()
+            if location is None:
+                return Response({"error": "Location not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            with transaction.atomic():
+                # Stock is reserved first so a sold-out item rolls back before any order exists
+                if location is not None:
+                    inventory.reserve_stock(location, cart_items)
+                order_ids = []
+                for cart_item in cart_items:
+                    order = Order.objects.create(
+                        customer_name=request.user.username,
+                        food_item=cart_item.food_item,
+                        location=location,
+                        delivery_status='Pending'
+                    )
+                    order_ids.append(order.id)
+                cart.cart_items.all().delete()
+                # Side effects run in run_outbox_worker once this transaction commits
+                outbox.publish('order.placed', {'customer_name': request.user.username, 'order_ids': order_ids,
+                                                'location_id': location.id if location else None},
+                               idempotency_key=f'order.placed:{order_ids[0]}')
+        except inventory.OutOfStock as exc:
+            return Response({
+                "error": "Some items are sold out at this location.",
+                "sold_out": [food_item.id for food_item in exc.food_items],
+            }, status=status.HTTP_409_CONFLICT)
         return Response({"message": "Order placed successfully."}, status=status.HTTP_200_OK)
 
-class CustomerOrdersView(APIView):
+class CustomerOrdersView(generics.ListAPIView):
+    """
+    Paginated order history for the current customer, archived orders included.
+
+    Responses carry an ETag so unchanged history costs a 304. Last-Modified is
+    sent as well, but If-Modified-Since is not honoured: HTTP dates only have
+    whole-second precision, so a change later in the same second would be
+    answered with a stale 304.
+    With ``?since=<ISO 8601 timestamp>`` only orders updated after that moment
+    are returned, paginated the same way, along with the ids of orders deleted
+    since then; clients page through with the same ``since`` and pass the
+    returned ``last_modified`` as ``since`` on their next sync. Deltas start
+    ``ORDER_SYNC_OVERLAP`` before ``since`` so rows written earlier but
+    committed after the previous sync are not missed; clients must dedupe
+    orders and deletions by id.
+    """
+    serializer_class = OrderHistorySerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [OrdersRateThrottle]
 
-    def get(self, request):
-        orders = Order.objects.filter(customer_name=request.user.username)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        return self.history()
+
+    def history(self, **filters):
+        return order_history(self.request.user.username, **filters)
+
+    def list(self, request, *args, **kwargs):
+        since = None
+        if 'since' in request.query_params:
+            try:
+                since = parse_datetime(request.query_params['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                return Response({"error": "since must be an ISO 8601 timestamp."}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        tombstones = OrderTombstone.objects.filter(customer_name=request.user.username)
+        # Archiving moves rows between the tables without changing the history
+        # as a whole, so it leaves both the count and last_modified unchanged
+        hot = Order.objects.filter(customer_name=request.user.username).aggregate(
+            count=Count('id'), last_updated=Max('updated_at'))
+        archived = ArchivedOrder.objects.filter(customer_name=request.user.username).aggregate(
+            count=Count('id'), last_updated=Max('updated_at'))
+        last_deleted = tombstones.aggregate(last_deleted=Max('deleted_at'))['last_deleted']
+        last_modified = max(filter(None, [hot['last_updated'], archived['last_updated'], last_deleted]), default=None)
+
+        # The representation also depends on the query string (page, since)
+        etag_source = f"{hot['count'] + archived['count']}:{last_modified}:{request.get_full_path()}"
+        etag = f'"{hashlib.sha256(etag_source.encode()).hexdigest()[:32]}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        if since is None:
+            response = super().list(request, *args, **kwargs)
+        else:
+            changed_after = since - settings.ORDER_SYNC_OVERLAP
+            page = self.paginate_queryset(self.history(updated_at__gt=changed_after))
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+            response.data['deleted'] = list(tombstones.filter(deleted_at__gt=changed_after)
+                                            .values_list('order_id', flat=True))
+            response.data['last_modified'] = last_modified
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            # Rounded up so the header is never earlier than the newest change
+            response['Last-Modified'] = http_date(math.ceil(last_modified.timestamp()))
+        return response
 